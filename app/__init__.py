@@ -1,24 +1,37 @@
-from flask import Flask, redirect, url_for
+from flask import Flask, current_app, redirect, url_for
 from typing import Optional, Dict, Any
+from sqlalchemy import func, select, update
 from .config import Config
 from .extensions import db, login_manager
-from .models import User
+from .json_provider import ORJSONProvider
+from .models import Booking, Event
 from .security import csrf
+from .services.user_cache import UserCache
 
 def create_app(config_overrides: Optional[Dict[str, Any]] = None) -> Flask:
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
     app.config.from_object(Config)
+    app.config["SQLALCHEMY_DATABASE_URI"] = Config.build_db_uri()
 
     if config_overrides:
         app.config.update(config_overrides)
 
+    app.config.setdefault(
+        "SQLALCHEMY_ENGINE_OPTIONS",
+        Config.build_engine_options(app.config["SQLALCHEMY_DATABASE_URI"]),
+    )
+
     db.init_app(app)
     login_manager.init_app(app)
     csrf.init_app(app)
 
+    app.extensions["user_cache"] = UserCache(ttl=app.config["USER_CACHE_TTL"])
+
+    # login_manager is shared by every app, so look the cache up per request
     @login_manager.user_loader
     def load_user(user_id: str):
-        return db.session.get(User, int(user_id))
+        return current_app.extensions["user_cache"].load(int(user_id))
 
     from .routes.auth import auth_bp
     app.register_blueprint(auth_bp)
@@ -43,4 +56,20 @@ def create_app(config_overrides: Optional[Dict[str, Any]] = None) -> Flask:
             db.create_all()
         print("Database initialised.")
 
+    @app.cli.command("sync-booked-counts")
+    def sync_booked_counts():
+        """Recompute events.booked_count from the bookings table."""
+        booked = (
+            select(func.count(Booking.id))
+            .where(Booking.event_id == Event.id)
+            .scalar_subquery()
+        )
+        with app.app_context():
+            db.session.execute(
+                update(Event).values(booked_count=booked),
+                execution_options={"synchronize_session": False},
+            )
+            db.session.commit()
+        print("Booked counts synced.")
+
     return app
@@ -4,8 +4,17 @@ class Config:
     SECRET_KEY = os.environ.get("FLASK_SECRET_KEY", "dev-change-me")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # seconds a loaded user is reused across requests (0 disables)
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "30"))
+
+    MAPS_API_KEY = (os.environ.get("MAPS_API_KEY") or "").strip()
+    SHOW_DEBUG = os.environ.get("SHOW_DEBUG") == "1"
+
     _DEFAULT_SQLITE = "sqlite:///local.db"
 
+    # SQLALCHEMY_DATABASE_URI / SQLALCHEMY_ENGINE_OPTIONS are resolved in
+    # create_app so env lookups happen per app, not at import time.
+
     @staticmethod
     def build_db_uri() -> str:
         conn_name = os.environ.get("CLOUD_SQL_CONNECTION_NAME")
@@ -21,6 +30,18 @@ class Config:
             )
 
         # Local dev: DATABASE_URL (optional) or sqlite
-        return os.environ.get("DATABASE_URL", "sqlite:///local.db")
+        return os.environ.get("DATABASE_URL", Config._DEFAULT_SQLITE)
+
+    @staticmethod
+    def build_engine_options(db_uri: str) -> dict:
+        # SQLite (local dev/tests) has no server-side pool to tune
+        if db_uri.startswith("sqlite"):
+            return {"connect_args": {"check_same_thread": False}}
 
-    SQLALCHEMY_DATABASE_URI = build_db_uri.__func__()
+        return {
+            "pool_size": 10,
+            "max_overflow": 20,
+            "pool_pre_ping": True,   # drop connections Cloud SQL closed while idle
+            "pool_recycle": 1800,
+            "query_cache_size": 1200,
+        }
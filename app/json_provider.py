@@ -0,0 +1,19 @@
+from typing import Any, Union
+
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson.
+
+    orjson serialises datetimes as ISO 8601 natively, so response dicts can
+    carry datetime values directly. Anything orjson can't handle falls back
+    to Flask's default conversions.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        return orjson.loads(s)
@@ -1,6 +1,11 @@
+import secrets
 from datetime import datetime, timezone
-from werkzeug.security import generate_password_hash, check_password_hash
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from werkzeug.security import check_password_hash
+from flask import current_app, has_app_context
 from flask_login import UserMixin
+from sqlalchemy import update
 from .extensions import db
 
 
@@ -8,6 +13,50 @@ def utcnow():
     return datetime.now(timezone.utc)
 
 
+# OWASP's argon2id baseline (19 MiB, t=2, p=1): cheaper per login than
+# Werkzeug's default hash while staying small enough for App Engine instances.
+_PH = PasswordHasher(time_cost=2, memory_cost=19456, parallelism=1)
+# Minimum-cost parameters for TESTING apps; verify() reads the parameters
+# back from each hash, so either kind of hash checks out with _PH.
+_TEST_PH = PasswordHasher(time_cost=1, memory_cost=8, parallelism=1)
+
+
+def _hasher() -> PasswordHasher:
+    if has_app_context() and current_app.config.get("TESTING"):
+        return _TEST_PH
+    return _PH
+
+
+def hash_password(password: str) -> str:
+    return _hasher().hash(password)
+
+
+def verify_password(password_hash: str, password: str) -> bool:
+    # Accounts created before the switch still carry Werkzeug hashes
+    if not password_hash.startswith("$argon2"):
+        return check_password_hash(password_hash, password)
+    try:
+        return _PH.verify(password_hash, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    # Werkzeug hashes cost ~4x an argon2 verify, and wrong-password checks on
+    # them take longer than the unknown-email dummy check; upgrade on login
+    if not password_hash.startswith("$argon2"):
+        return True
+    try:
+        return _hasher().check_needs_rehash(password_hash)
+    except InvalidHashError:
+        return True
+
+
+def new_ticket_code() -> str:
+    # 128 bits as 22 URL-safe chars; uniqueness is still enforced by the DB constraint
+    return secrets.token_urlsafe(16)
+
+
 class User(db.Model, UserMixin):
     __tablename__ = "users"
 
@@ -29,10 +78,10 @@ class User(db.Model, UserMixin):
     )
 
     def set_password(self, password: str) -> None:
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = hash_password(password)
 
     def check_password(self, password: str) -> bool:
-        return check_password_hash(self.password_hash, password)
+        return verify_password(self.password_hash, password)
 
 
 class Event(db.Model):
@@ -49,11 +98,19 @@ class Event(db.Model):
     lat = db.Column(db.Float, nullable=True)
     lng = db.Column(db.Float, nullable=True)
 
-    start_time = db.Column(db.DateTime, nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False, index=True)
     end_time = db.Column(db.DateTime, nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
 
+    # taken by Event.claim_seat and given back by Event.release_seat, both via
+    # services.booking; bookings removed any other way need sync-booked-counts
+    booked_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     created_at = db.Column(db.DateTime, nullable=False, default=utcnow)
+    # server_default lets the column be added to a populated table
+    updated_at = db.Column(
+        db.DateTime, nullable=False, default=utcnow, onupdate=utcnow, server_default=db.func.now()
+    )
     created_by = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
     creator = db.relationship("User", back_populates="events")
@@ -64,8 +121,28 @@ class Event(db.Model):
         cascade="all, delete-orphan",
     )
 
-    def booked_count(self) -> int:
-        return len(self.bookings)
+    @classmethod
+    def claim_seat(cls, event_id: int) -> bool:
+        """Take one seat with a single conditional UPDATE.
+
+        Returns False when the event is full (or missing). Runs in the
+        caller's transaction, so a rollback gives the seat back.
+        """
+        result = db.session.execute(
+            update(cls)
+            .where(cls.id == event_id, cls.booked_count < cls.capacity)
+            .values(booked_count=cls.booked_count + 1)
+        )
+        return result.rowcount == 1
+
+    @classmethod
+    def release_seat(cls, event_id: int) -> None:
+        """Give one seat back, in the caller's transaction; never goes below zero."""
+        db.session.execute(
+            update(cls)
+            .where(cls.id == event_id, cls.booked_count > 0)
+            .values(booked_count=cls.booked_count - 1)
+        )
 
 
 class Booking(db.Model):
@@ -73,7 +150,7 @@ class Booking(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey("events.id"), nullable=False, index=True)
 
     ticket_code = db.Column(db.String(64), unique=True, nullable=True, index=True)
@@ -85,4 +162,16 @@ class Booking(db.Model):
 
     __table_args__ = (
         db.UniqueConstraint("user_id", "event_id", name="uq_user_event_booking"),
+        # my_bookings: WHERE user_id = ? ORDER BY created_at DESC
+        db.Index("ix_bookings_user_created", "user_id", created_at.desc()),
+        # check-in function: WHERE ticket_code = ? AND event_id = ?, answered
+        # from the index alone on Postgres (INCLUDE is ignored elsewhere)
+        db.Index(
+            "ix_bookings_ticket_event",
+            "ticket_code",
+            "event_id",
+            unique=True,
+            postgresql_include=["id", "user_id", "created_at"],
+        ),
     )
+
@@ -1,24 +1,27 @@
 from __future__ import annotations
-import os
-import json
+import hashlib
 from datetime import datetime
-from typing import Any, Dict, Optional
-from flask import Blueprint, jsonify, request
+from typing import Any, Dict
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
 from flask_login import current_user, login_required
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from ..services.booking import BookingError, create_booking
 from ..services.logging_service import log_event
+from ..services.tickets import TicketSendError, send_ticket, ticket_email_html
 from ..extensions import db
 from ..models import Event, Booking, User
 from ..security import csrf
-import uuid
-from urllib import request as urlrequest
-from urllib.error import HTTPError, URLError
-from urllib.parse import quote_plus
-
-
+from concurrent.futures import ThreadPoolExecutor
 
 
 api_bp = Blueprint("api", __name__, url_prefix="/api")
 
+_EMAIL_BATCH_MAX = 100
+_EMAIL_BATCH_WORKERS = 8
+_EVENT_DETAIL_MAX_AGE = 30
+_EVENTS_STREAM_BATCH = 200
+
 def _parse_iso_dt(value: Any):
     if value is None:
         return None
@@ -29,18 +32,8 @@ def _parse_iso_dt(value: Any):
         return datetime.fromisoformat(value)
     raise ValueError("Invalid datetime format")
 
-def _iso(dt: Any) -> Optional[str]:
-    if dt is None:
-        return None
-    if isinstance(dt, str):
-        return dt
-    if isinstance(dt, datetime):
-        return dt.isoformat()
-    return str(dt)
-
-
 def _event_to_dict(event: Event) -> Dict[str, Any]:
-    booked = Booking.query.filter_by(event_id=event.id).count()
+    booked = event.booked_count
     remaining = max(int(event.capacity) - booked, 0) if event.capacity is not None else None
 
     return {
@@ -48,16 +41,22 @@ def _event_to_dict(event: Event) -> Dict[str, Any]:
         "title": event.title,
         "description": event.description,
         "location": event.location,
-        "start_time": _iso(event.start_time),
-        "end_time": _iso(event.end_time),
+        "start_time": event.start_time,
+        "end_time": event.end_time,
         "capacity": event.capacity,
         "booked": booked,
         "remaining": remaining,
         "created_by": event.created_by,
-        "created_at": _iso(event.created_at),
+        "created_at": event.created_at,
     }
 
 
+def _event_etag(event: Event) -> str:
+    # updated_at also moves on booking changes; booked_count guards against equal timestamps
+    key = f"{event.id}:{event.updated_at.isoformat()}:{event.booked_count}"
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=8).hexdigest()
+
+
 def _booking_to_dict(booking: Booking) -> Dict[str, Any]:
     ticket_code = getattr(booking, "ticket_code", None)
     return {
@@ -65,10 +64,25 @@ def _booking_to_dict(booking: Booking) -> Dict[str, Any]:
         "user_id": booking.user_id,
         "event_id": booking.event_id,
         "ticket_code": ticket_code,
-        "created_at": _iso(booking.created_at),
+        "created_at": booking.created_at,
     }
 
 
+def _send_ticket_email(item: Dict[str, Any]) -> Dict[str, Any]:
+    # Runs on a worker thread: only plain values in, no ORM/session access
+    result = {"booking_id": item["booking_id"], "ok": False}
+    try:
+        send_ticket(
+            item["to_email"],
+            item["ticket_code"],
+            ticket_email_html(item["event_title"], item["ticket_code"]),
+        )
+    except TicketSendError as e:
+        return {**result, "error": e.reason, "message": str(e)}
+
+    return {**result, "ok": True}
+
+
 def _is_admin() -> bool:
     return bool(getattr(current_user, "role", None) == "admin")
 
@@ -84,111 +98,10 @@ def _forbidden(msg: str = "Forbidden"):
 def _not_found(msg: str = "Not found"):
     return jsonify({"error": "not_found", "message": msg}), 404
 
-def _id_token_for_audience(audience: str) -> str:
-    # Works on Google-managed runtimes (App Engine / Cloud Run / Functions) via metadata server
-    token_url = (
-        "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/identity"
-        f"?audience={quote_plus(audience)}&format=full"
-    )
-    req = urlrequest.Request(token_url, headers={"Metadata-Flavor": "Google"}, method="GET")
-    with urlrequest.urlopen(req, timeout=5) as resp:
-        return resp.read().decode("utf-8")
-
-def _call_checkin_function(payload: Dict[str, Any]) -> Dict[str, Any]:
-    url = os.environ.get("CHECKIN_FUNCTION_URL")
-    secret = os.environ.get("CHECKIN_FUNCTION_SECRET")
-
-    if not url:
-        raise RuntimeError("CHECKIN_FUNCTION_URL not set")
-    if not secret:
-        raise RuntimeError("CHECKIN_FUNCTION_SECRET not set")
-
-    token = _id_token_for_audience(url)
-
-    body = json.dumps(payload).encode("utf-8")
-    req = urlrequest.Request(
-        url=url,
-        data=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Checkin-Secret": secret,
-            "Authorization": f"Bearer {token}",
-        },
-        method="POST",
-    )
-
-    try:
-        with urlrequest.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except HTTPError as e:
-        raw = e.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Function HTTP {e.code}: {raw[:200]}")
-    except URLError as e:
-        raise RuntimeError(f"Function unreachable: {e}")
-
-def _call_qr_function(payload: Dict[str, Any]) -> Dict[str, Any]:
-    url = os.environ.get("QR_FUNCTION_URL")
-    secret = os.environ.get("QR_FUNCTION_SECRET")
-
-    if not url:
-        raise RuntimeError("QR_FUNCTION_URL not set")
-    if not secret:
-        raise RuntimeError("QR_FUNCTION_SECRET not set")
-
-    token = _id_token_for_audience(url)
-
-    body = json.dumps(payload).encode("utf-8")
-    req = urlrequest.Request(
-        url=url,
-        data=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-QR-Secret": secret,
-            "Authorization": f"Bearer {token}",
-        },
-        method="POST",
-    )
-
-    try:
-        with urlrequest.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except HTTPError as e:
-        raw = e.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"QR Function HTTP {e.code}: {raw[:200]}")
-    except URLError as e:
-        raise RuntimeError(f"QR Function unreachable: {e}")
-
-def _call_email_function(payload: Dict[str, Any]) -> Dict[str, Any]:
-    url = os.environ.get("EMAIL_FUNCTION_URL")
-    secret = os.environ.get("EMAIL_FUNCTION_SECRET")
-
-    if not url:
-        raise RuntimeError("EMAIL_FUNCTION_URL not set")
-    if not secret:
-        raise RuntimeError("EMAIL_FUNCTION_SECRET not set")
-
-    token = _id_token_for_audience(url)
-
-    body = json.dumps(payload).encode("utf-8")
-    req = urlrequest.Request(
-        url=url,
-        data=body,
-        headers={
-            "Content-Type": "application/json",
-            "X-Email-Secret": secret,
-            "Authorization": f"Bearer {token}",
-        },
-        method="POST",
-    )
 
-    try:
-        with urlrequest.urlopen(req, timeout=10) as resp:
-            return json.loads(resp.read().decode("utf-8"))
-    except HTTPError as e:
-        raw = e.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"Email Function HTTP {e.code}: {raw[:200]}")
-    except URLError as e:
-        raise RuntimeError(f"Email Function unreachable: {e}")
+def _already_booked_response(event_id: int):
+    existing = Booking.query.filter_by(event_id=event_id, user_id=current_user.id).first()
+    return jsonify({"error": "conflict", "message": "Already booked", "booking": _booking_to_dict(existing)}), 409
 
 @api_bp.get("/me")
 def me():
@@ -207,17 +120,30 @@ def me():
 
 @api_bp.get("/events")
 def list_events():
-    events = Event.query.order_by(Event.start_time.asc()).all()
-    return jsonify({"events": [_event_to_dict(e) for e in events]}), 200
+    # Stream rows from the cursor in batches and emit each event as it is
+    # serialised, instead of materialising every ORM object and dict first.
+    stmt = select(Event).order_by(Event.start_time.asc()).execution_options(yield_per=_EVENTS_STREAM_BATCH)
+
+    def generate():
+        yield '{"events":['
+        for i, event in enumerate(db.session.scalars(stmt)):
+            yield ("," if i else "") + current_app.json.dumps(_event_to_dict(event))
+        yield "]}\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
 
 
 @api_bp.get("/events/<int:event_id>")
 def event_detail(event_id: int):
-    event = Event.query.get(event_id)
+    event = db.session.get(Event, event_id)
     if not event:
         return _not_found("Event not found")
 
-    return jsonify({"event": _event_to_dict(event)}), 200
+    response = jsonify({"event": _event_to_dict(event)})
+    response.set_etag(_event_etag(event))
+    response.cache_control.public = True
+    response.cache_control.max_age = _EVENT_DETAIL_MAX_AGE
+    return response.make_conditional(request)
 
 @csrf.exempt
 @api_bp.post("/events")
@@ -276,28 +202,14 @@ def create_event():
 @api_bp.post("/events/<int:event_id>/book")
 @login_required
 def book_event(event_id: int):
-    event = db.session.get(Event, event_id)
-    if not event:
-        return _not_found("Event not found")
-
-    # Prevent double booking
-    existing = Booking.query.filter_by(event_id=event_id, user_id=current_user.id).first()
-    if existing:
-        return jsonify({"error": "conflict", "message": "Already booked", "booking": _booking_to_dict(existing)}), 409
-
-    # Capacity check
-    booked = Booking.query.filter_by(event_id=event_id).count()
-    if event.capacity is not None and booked >= int(event.capacity):
-        return jsonify({"error": "conflict", "message": "Event is full"}), 409
-
-    booking = Booking(
-        user_id=current_user.id,
-        event_id=event_id,
-        ticket_code=str(uuid.uuid4())
-    )
-
-    db.session.add(booking)
-    db.session.commit()
+    try:
+        booking = create_booking(current_user.id, event_id)
+    except BookingError as e:
+        if e.reason == BookingError.NOT_FOUND:
+            return _not_found("Event not found")
+        if e.reason == BookingError.FULL:
+            return jsonify({"error": "conflict", "message": "Event is full"}), 409
+        return _already_booked_response(event_id)
 
     return jsonify({"booking": _booking_to_dict(booking)}), 201
 
@@ -305,18 +217,19 @@ def book_event(event_id: int):
 @api_bp.get("/bookings")
 @login_required
 def my_bookings():
-    bookings = Booking.query.filter_by(user_id=current_user.id).order_by(Booking.created_at.desc()).all()
+    bookings = db.session.scalars(
+        select(Booking)
+        .where(Booking.user_id == current_user.id)
+        .options(selectinload(Booking.event))
+        .order_by(Booking.created_at.desc())
+    ).all()
 
     # Include event details for convenience
-    event_ids = {b.event_id for b in bookings}
-    events = Event.query.filter(Event.id.in_(event_ids)).all() if event_ids else []
-    event_map = {e.id: _event_to_dict(e) for e in events}
-
     return jsonify({
         "bookings": [
             {
                 **_booking_to_dict(b),
-                "event": event_map.get(b.event_id),
+                "event": _event_to_dict(b.event),
             }
             for b in bookings
         ]
@@ -333,8 +246,10 @@ def checkin_validate():
     if not ticket_code or event_id is None:
         return _bad_request("ticket_code and event_id are required")
 
+    from ..services.external import call_checkin_function
+
     try:
-        result = _call_checkin_function({"ticket_code": ticket_code, "event_id": int(event_id)})
+        result = call_checkin_function({"ticket_code": ticket_code, "event_id": int(event_id)})
     except Exception as e:
         return jsonify({"error": "function_error", "message": str(e)}), 502
 
@@ -354,8 +269,18 @@ def booking_qr_by_ticket(ticket_code: str):
     if booking.user_id != current_user.id and not _is_admin():
         return _forbidden("Not allowed")
 
+    from ..services.external import call_qr_function, fetch_qr_svg
+
+    # ?format=svg returns the image itself, e.g. for an <img src> on the ticket page
+    if request.args.get("format") == "svg":
+        try:
+            svg = fetch_qr_svg(booking.ticket_code)
+        except Exception as e:
+            return jsonify({"error": "function_error", "message": str(e)}), 502
+        return Response(svg, mimetype="image/svg+xml")
+
     try:
-        result = _call_qr_function({"ticket_code": booking.ticket_code})
+        result = call_qr_function({"ticket_code": booking.ticket_code})
     except Exception as e:
         return jsonify({"error": "function_error", "message": str(e)}), 502
 
@@ -371,34 +296,17 @@ def email_booking_ticket(booking_id: int):
     if booking.user_id != current_user.id and not _is_admin():
         return _forbidden("Not allowed")
 
-    # generate QR first
-    try:
-        qr = _call_qr_function({"ticket_code": booking.ticket_code})
-    except Exception as e:
-        return jsonify({"error": "qr_error", "message": str(e)}), 502
-
-    # simple email body
-    html = f"""
-    <h1>Your booking</h1>
-    <p>Event ID: {booking.event_id}</p>
-    <p>Ticket code: <strong>{booking.ticket_code}</strong></p>
-    <p>Your QR code is attached.</p>
-    """
-
     # look up the user's email
     user = db.session.get(User, booking.user_id)
     if not user:
         return _not_found("User not found")
 
     try:
-        result = _call_email_function({
-            "to_email": user.email,
-            "subject": "Your Campus Event Ticket",
-            "html": html,
-            "qr_png_base64": qr.get("png_base64", ""),
-        })
-    except Exception as e:
-        return jsonify({"error": "email_error", "message": str(e)}), 502
+        result = send_ticket(
+            user.email, booking.ticket_code, ticket_email_html(booking.event.title, booking.ticket_code)
+        )
+    except TicketSendError as e:
+        return jsonify({"error": e.reason, "message": str(e)}), 502
 
     log_event(
         "ticket_email_sent",
@@ -412,3 +320,55 @@ def email_booking_ticket(booking_id: int):
     )
 
     return jsonify({"ok": True, "email_result": result}), 200
+
+@csrf.exempt
+@api_bp.post("/bookings/email-batch")
+@login_required
+def email_booking_tickets_batch():
+    data = request.get_json(silent=True) or {}
+    booking_ids = data.get("booking_ids")
+
+    if not isinstance(booking_ids, list) or not booking_ids:
+        return _bad_request("booking_ids must be a non-empty list")
+    if len(booking_ids) > _EMAIL_BATCH_MAX:
+        return _bad_request(f"at most {_EMAIL_BATCH_MAX} booking_ids per request")
+    try:
+        booking_ids = {int(b) for b in booking_ids}
+    except (TypeError, ValueError):
+        return _bad_request("booking_ids must be integers")
+
+    bookings = db.session.scalars(
+        select(Booking)
+        .where(Booking.id.in_(booking_ids))
+        .options(selectinload(Booking.user), selectinload(Booking.event))
+    ).all()
+
+    missing = booking_ids - {b.id for b in bookings}
+    if missing:
+        return _not_found(f"Booking not found: {sorted(missing)}")
+
+    if not _is_admin() and any(b.user_id != current_user.id for b in bookings):
+        return _forbidden("Not allowed")
+
+    items = [
+        {
+            "booking_id": b.id,
+            "event_title": b.event.title,
+            "ticket_code": b.ticket_code,
+            "to_email": b.user.email,
+        }
+        for b in bookings
+    ]
+
+    # QR + email are two network round trips per ticket; run tickets in parallel
+    with ThreadPoolExecutor(max_workers=min(_EMAIL_BATCH_WORKERS, len(items))) as pool:
+        results = list(pool.map(_send_ticket_email, items))
+
+    sent = [r["booking_id"] for r in results if r["ok"]]
+    log_event(
+        "ticket_email_batch_sent",
+        user_id=current_user.id,
+        meta={"booking_ids": sent, "failed": len(results) - len(sent)},
+    )
+
+    return jsonify({"ok": len(sent) == len(results), "results": results}), 200
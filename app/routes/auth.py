@@ -1,14 +1,17 @@
-import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
 from flask_login import login_user, logout_user, login_required, current_user
 from sqlalchemy import select
 from ..extensions import db
-from ..models import User
+from ..models import User, hash_password, password_needs_rehash, verify_password
 from ..services.logging_service import log_event
 
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
+# Verified against when the email is unknown, so a miss costs the same as a
+# wrong password and response time doesn't reveal which accounts exist.
+_DUMMY_HASH = hash_password("dummy-password")
+
 
 @auth_bp.get("/register")
 def register():
@@ -52,10 +55,20 @@ def login_post():
     password = request.form.get("password") or ""
 
     user = db.session.scalar(select(User).where(User.email == email))
-    if not user or not user.check_password(password):
+    if user:
+        password_ok = user.check_password(password)
+    else:
+        password_ok = verify_password(_DUMMY_HASH, password)
+
+    if not user or not password_ok:
         flash("Invalid email or password.", "error")
         return redirect(url_for("auth.login"))
 
+    # the plaintext is only available here, so legacy hashes are upgraded now
+    if password_needs_rehash(user.password_hash):
+        user.set_password(password)
+        db.session.commit()
+
     login_user(user)
     log_event("user_login", user_id=user.id)
     flash("Logged in.", "success")
@@ -67,6 +80,7 @@ def login_post():
 def logout():
     uid = current_user.id
     logout_user()
+    current_app.extensions["user_cache"].invalidate(uid)
     log_event("user_logout", user_id=uid)
     flash("Logged out.", "success")
     return redirect(url_for("home"))
@@ -75,6 +89,6 @@ def logout():
 @auth_bp.get("/me")
 @login_required
 def me():
-    show_debug = (current_user.role == "admin") and (os.environ.get("SHOW_DEBUG") == "1")
+    show_debug = (current_user.role == "admin") and current_app.config["SHOW_DEBUG"]
     db_uri = str(db.engine.url) if show_debug else None
     return render_template("auth/me.html", db_uri=db_uri)
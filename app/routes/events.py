@@ -1,22 +1,33 @@
-import os
-import uuid
 from datetime import datetime
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
 from flask_login import login_required, current_user
 from sqlalchemy import select
-from sqlalchemy.exc import IntegrityError
 from ..extensions import db
-from ..models import Event, Booking
+from ..models import Event
+from ..services.booking import BookingError, create_booking
 from ..services.logging_service import log_event
-from urllib.parse import quote_plus
+from ..services.tasks import enqueue_ticket_dispatch
 
 
 events_bp = Blueprint("events", __name__, url_prefix="/events")
 
+_BOOKING_ERRORS = {
+    BookingError.NOT_FOUND: "Event not found.",
+    BookingError.ALREADY_BOOKED: "You already booked this event.",
+    BookingError.FULL: "Event is full.",
+}
+
 
 def parse_dt(value: str):
-    # expects "YYYY-MM-DDTHH:MM" from <input type="datetime-local">
-    return datetime.strptime(value, "%Y-%m-%dT%H:%M")
+    # expects "YYYY-MM-DDTHH:MM" from <input type="datetime-local">; the fixed
+    # layout is sliced directly rather than going through strptime's regex machinery
+    if len(value) != 16 or value[4] != "-" or value[7] != "-" or value[10] != "T" or value[13] != ":":
+        raise ValueError(f"Invalid datetime-local value: {value!r}")
+    fields = (value[0:4], value[5:7], value[8:10], value[11:13], value[14:16])
+    # int() alone would accept signs, spaces and non-ASCII digits
+    if not all(f.isascii() and f.isdigit() for f in fields):
+        raise ValueError(f"Invalid datetime-local value: {value!r}")
+    return datetime(*map(int, fields))
 
 
 @events_bp.get("/")
@@ -32,7 +43,7 @@ def new_event():
         flash("Admin only.", "error")
         return redirect(url_for("events.list_events"))
 
-    maps_js_key = os.environ.get("MAPS_API_KEY", "").strip()
+    maps_js_key = current_app.config["MAPS_API_KEY"]
     return render_template("events/new.html", maps_js_key=maps_js_key)
 
 
@@ -110,68 +121,14 @@ def new_event_post():
 @events_bp.post("/<int:event_id>/book")
 @login_required
 def book_event(event_id: int):
-    event = db.session.get(Event, event_id)
-    if not event:
-        flash("Event not found.", "error")
-        return redirect(url_for("events.list_events"))
-
-    booked = db.session.scalar(
-        select(db.func.count(Booking.id)).where(Booking.event_id == event_id)
-    )
-    if booked >= event.capacity:
-        flash("Event is full.", "error")
-        return redirect(url_for("events.list_events"))
-
-    booking = Booking(
-        user_id=current_user.id,
-        event_id=event_id,
-        ticket_code=str(uuid.uuid4())
-    )
-    db.session.add(booking)
-
     try:
-        db.session.commit()
-    except IntegrityError:
-        db.session.rollback()
-        flash("You already booked this event.", "error")
+        booking = create_booking(current_user.id, event_id)
+    except BookingError as e:
+        flash(_BOOKING_ERRORS[e.reason], "error")
         return redirect(url_for("events.list_events"))
 
-    qr_url = (os.environ.get("QR_FUNCTION_URL") or "").strip()
-    qr_secret = (os.environ.get("QR_FUNCTION_SECRET") or "").strip()
-    email_url = (os.environ.get("EMAIL_FUNCTION_URL") or "").strip()
-    email_secret = (os.environ.get("EMAIL_FUNCTION_SECRET") or "").strip()
-
-    if qr_url and qr_secret and email_url and email_secret and current_user.email:
-        try:
-            qr_r = requests.post(
-                qr_url,
-                headers={"X-QR-Secret": qr_secret, "Content-Type": "application/json"},
-                json={"ticket_code": booking.ticket_code},
-                timeout=15,
-            )
-            qr_r.raise_for_status()
-            qr_data = qr_r.json()
-            qr_png_base64 = (qr_data.get("png_base64") or "").strip()
-
-            if qr_png_base64:
-                email_r = requests.post(
-                    email_url,
-                    headers={"X-Email-Secret": email_secret, "Content-Type": "application/json"},
-                    json={
-                        "to_email": current_user.email,
-                        "subject": "Your Campus Event Ticket",
-                        "html": (
-                            f"<p>Thanks for booking <strong>{event.title}</strong>.</p>"
-                            f"<p>Your ticket code is <strong>{booking.ticket_code}</strong>.</p>"
-                            f"<p>Show the QR code at check-in.</p>"
-                        ),
-                        "qr_png_base64": qr_png_base64,
-                    },
-                    timeout=15,
-                )
-                email_r.raise_for_status()
-        except Exception:
-            pass
+    # QR + email are two outbound calls; send them after the response
+    enqueue_ticket_dispatch(booking.id, booking.ticket_code, current_user.email, booking.event.title)
 
     log_event(
         "booking_created",
@@ -189,26 +146,8 @@ def event_detail(event_id: int):
         flash("Event not found.", "error")
         return redirect(url_for("events.list_events"))
 
-    maps_js_key = os.environ.get("MAPS_API_KEY", "").strip()
-
-    maps_embed_url = None
-    if maps_js_key and event.location:
-        q = quote_plus(event.location)
-        maps_embed_url = f"https://www.google.com/maps/embed/v1/place?key={maps_js_key}&q={q}"
-
     return render_template(
         "events/detail.html",
         event=event,
-        maps_js_key=maps_js_key,
-        maps_embed_url=maps_embed_url,
-    )
-
-def _call_function(url: str, secret_header: str, secret_value: str, payload: dict) -> dict:
-    r = requests.post(
-        url,
-        headers={secret_header: secret_value, "Content-Type": "application/json"},
-        json=payload,
-        timeout=15,
+        maps_js_key=current_app.config["MAPS_API_KEY"],
     )
-    r.raise_for_status()
-    return r.json()
\ No newline at end of file
@@ -0,0 +1,64 @@
+from __future__ import annotations
+
+from sqlalchemy import exists, select
+from sqlalchemy.exc import IntegrityError
+
+from ..extensions import db
+from ..models import Booking, Event, new_ticket_code
+
+
+class BookingError(Exception):
+    """A booking that was refused; `reason` is one of the constants below."""
+
+    NOT_FOUND = "not_found"
+    ALREADY_BOOKED = "already_booked"
+    FULL = "full"
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def _already_booked(user_id: int, event_id: int) -> bool:
+    return bool(db.session.scalar(
+        select(exists().where(Booking.event_id == event_id, Booking.user_id == user_id))
+    ))
+
+
+def create_booking(user_id: int, event_id: int) -> Booking:
+    """Book one seat on `event_id` for `user_id` and commit it.
+
+    Shared by the HTML and JSON booking views, which only differ in how they
+    report a BookingError.
+    """
+    event = db.session.get(Event, event_id)
+    if not event:
+        raise BookingError(BookingError.NOT_FOUND)
+
+    if _already_booked(user_id, event_id):
+        raise BookingError(BookingError.ALREADY_BOOKED)
+
+    # Capacity check and seat reservation in one conditional UPDATE
+    if not Event.claim_seat(event_id):
+        db.session.rollback()
+        raise BookingError(BookingError.FULL)
+
+    booking = Booking(user_id=user_id, event_id=event_id, ticket_code=new_ticket_code())
+    db.session.add(booking)
+
+    # seat claim and insert commit together; a concurrent duplicate trips
+    # uq_user_event_booking and rolls both back
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise BookingError(BookingError.ALREADY_BOOKED)
+
+    return booking
+
+
+def cancel_booking(booking: Booking) -> None:
+    """Delete `booking` and give its seat back in the same commit."""
+    Event.release_seat(booking.event_id)
+    db.session.delete(booking)
+    db.session.commit()
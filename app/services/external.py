@@ -0,0 +1,148 @@
+from __future__ import annotations
+
+import base64
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Outbound calls to the Cloud Functions. Imported lazily by the API views
+# so routes that never leave the process don't pay for it at cold start.
+
+# One keep-alive pool shared by every outbound call from this worker
+# (connect errors and 502/503/504 on idempotent requests are retried; a POST
+# that reached the function is never replayed)
+_HTTP = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504]),
+)
+_HTTP.mount("https://", _ADAPTER)
+_HTTP.mount("http://", _ADAPTER)
+
+# Function URLs and shared secrets, read once per process
+_TICKET_ENV_NAMES = (
+    "QR_FUNCTION_URL", "QR_FUNCTION_SECRET",
+    "EMAIL_FUNCTION_URL", "EMAIL_FUNCTION_SECRET",
+)
+_ENV_NAMES = ("CHECKIN_FUNCTION_URL", "CHECKIN_FUNCTION_SECRET") + _TICKET_ENV_NAMES
+_settings: Dict[str, str] = {name: (os.environ.get(name) or "").strip() for name in _ENV_NAMES}
+
+
+def ticket_functions_configured() -> bool:
+    """True when both the QR and email functions have a URL and secret."""
+    return all(_settings[name] for name in _TICKET_ENV_NAMES)
+
+
+# audience -> (token, exp); Google-signed ID tokens live for about an hour
+_token_cache: Dict[str, Tuple[str, float]] = {}
+_token_lock = threading.Lock()
+_TOKEN_FALLBACK_TTL = 55 * 60
+_TOKEN_REFRESH_MARGIN = 60
+
+
+def _token_expiry(token: str) -> float:
+    try:
+        payload = token.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        return float(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+    except Exception:
+        return time.time() + _TOKEN_FALLBACK_TTL
+
+
+def _id_token_for_audience(audience: str) -> str:
+    with _token_lock:
+        cached = _token_cache.get(audience)
+    if cached and cached[1] > time.time() + _TOKEN_REFRESH_MARGIN:
+        return cached[0]
+
+    token = _fetch_id_token(audience)
+    with _token_lock:
+        _token_cache[audience] = (token, _token_expiry(token))
+    return token
+
+
+def _fetch_id_token(audience: str) -> str:
+    # Works on Google-managed runtimes (App Engine / Cloud Run / Functions) via metadata server
+    r = _HTTP.get(
+        "http://metadata.google.internal/computeMetadata/v1/instance/service-accounts/default/identity",
+        params={"audience": audience, "format": "full"},
+        headers={"Metadata-Flavor": "Google"},
+        timeout=5,
+    )
+    r.raise_for_status()
+    return r.text
+
+
+def _post_function(label: str, url_env: str, secret_env: str, secret_header: str,
+                   **kwargs: Any) -> requests.Response:
+    url = _settings[url_env]
+    secret = _settings[secret_env]
+
+    if not url:
+        raise RuntimeError(f"{url_env} not set")
+    if not secret:
+        raise RuntimeError(f"{secret_env} not set")
+
+    token = _id_token_for_audience(url)
+    headers = {
+        **kwargs.pop("headers", {}),
+        secret_header: secret,
+        "Authorization": f"Bearer {token}",
+    }
+
+    try:
+        r = _HTTP.post(url, headers=headers, timeout=10, **kwargs)
+    except requests.RequestException as e:
+        raise RuntimeError(f"{label} unreachable: {e}")
+
+    if not r.ok:
+        raise RuntimeError(f"{label} HTTP {r.status_code}: {r.text[:200]}")
+    return r
+
+
+def _post_qr(**kwargs: Any) -> requests.Response:
+    return _post_function("QR Function", "QR_FUNCTION_URL", "QR_FUNCTION_SECRET", "X-QR-Secret", **kwargs)
+
+
+def call_checkin_function(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return _post_function(
+        "Function", "CHECKIN_FUNCTION_URL", "CHECKIN_FUNCTION_SECRET", "X-Checkin-Secret", json=payload,
+    ).json()
+
+
+def call_qr_function(payload: Dict[str, Any]) -> Dict[str, Any]:
+    return _post_qr(json=payload).json()
+
+
+def _fetch_qr_image(ticket_code: str, mimetype: str) -> bytes:
+    r = _post_qr(json={"ticket_code": ticket_code}, headers={"Accept": mimetype})
+    # an old QR build (or one ignoring Accept) answers with JSON, which must
+    # not end up attached to an email as the ticket image
+    content_type = r.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    if content_type != mimetype:
+        raise RuntimeError(f"QR Function returned {content_type or 'no Content-Type'}, expected {mimetype}")
+    return r.content
+
+
+def fetch_qr_png(ticket_code: str) -> bytes:
+    # Raw PNG bytes: no base64 in the QR response or the email request
+    return _fetch_qr_image(ticket_code, "image/png")
+
+
+def fetch_qr_svg(ticket_code: str) -> bytes:
+    return _fetch_qr_image(ticket_code, "image/svg+xml")
+
+
+def send_ticket_email(to_email: str, subject: str, html: str, qr_png: bytes) -> Dict[str, Any]:
+    return _post_function(
+        "Email Function", "EMAIL_FUNCTION_URL", "EMAIL_FUNCTION_SECRET", "X-Email-Secret",
+        data={"to_email": to_email, "subject": subject, "html": html},
+        files={"qr": ("ticket-qr.png", qr_png, "image/png")},
+    ).json()
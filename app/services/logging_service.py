@@ -1,15 +1,28 @@
 from __future__ import annotations
 
-from datetime import datetime, timezone
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
+import atexit
 import os
+import queue
+import threading
+import time
 
-from flask import current_app
 from google.cloud import firestore
 
 _client: Optional[firestore.Client] = None
 _DISABLE = os.environ.get("DISABLE_FIRESTORE_LOGS") == "1"
 
+# Log docs are queued and written off the request path by a daemon thread,
+# up to _BATCH_SIZE per Firestore batch commit (Firestore caps a batch at 500).
+_BATCH_SIZE = 400
+_FLUSH_INTERVAL = 0.2  # seconds to wait for more docs before committing
+_QUEUE_MAX = 10_000    # beyond this, logs are dropped rather than using unbounded memory
+_EXIT_TIMEOUT = 5.0    # how long interpreter exit waits for the writer to finish
+# None is the stop sentinel: the writer commits what it holds and exits
+_queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=_QUEUE_MAX)
+_worker: Optional[threading.Thread] = None
+_worker_lock = threading.Lock()
+
 def _get_client() -> firestore.Client:
     global _client
     if _client is None:
@@ -25,6 +38,67 @@ def _get_client() -> firestore.Client:
             _client = firestore.Client()
     return _client
 
+def _write_batch(docs: List[Dict[str, Any]]) -> None:
+    try:
+        client = _get_client()
+        logs = client.collection("logs")
+        batch = client.batch()
+        for doc in docs:
+            batch.set(logs.document(), doc)
+        batch.commit()
+    except Exception as e:
+        print("Firestore logging failed:", repr(e))
+
+def _drain() -> None:
+    while True:
+        first = _queue.get()
+        if first is None:
+            return
+        docs = [first]
+        stop = False
+        deadline = time.monotonic() + _FLUSH_INTERVAL
+        while len(docs) < _BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                doc = _queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if doc is None:
+                stop = True
+                break
+            docs.append(doc)
+        _write_batch(docs)
+        if stop:
+            return
+
+def _flush() -> None:
+    # Runs at interpreter exit: stop the writer behind everything already
+    # queued and wait for it, so its in-flight batch is committed too
+    worker = _worker
+    if worker is None or not worker.is_alive():
+        return
+    try:
+        _queue.put(None, timeout=_EXIT_TIMEOUT)
+    except queue.Full:
+        print("Firestore logging: queue still full at exit, pending logs dropped")
+        return
+    worker.join(_EXIT_TIMEOUT)
+
+def _ensure_worker() -> None:
+    global _worker
+    if _worker is not None and _worker.is_alive():
+        return
+    with _worker_lock:
+        # started lazily so each forked gunicorn worker gets its own thread
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_drain, name="firestore-log-writer", daemon=True)
+            _worker.start()
+
+# registered once; a no-op in processes that never started a writer
+atexit.register(_flush)
+
 def log_event(action: str, user_id: Optional[int] = None, meta: Optional[Dict[str, Any]] = None) -> None:
     if _DISABLE:
         return
@@ -33,10 +107,11 @@ def log_event(action: str, user_id: Optional[int] = None, meta: Optional[Dict[st
         "action": action,
         "user_id": user_id,
         "meta": meta or {},
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        # set by Firestore when the batch commits; stored as a queryable timestamp
+        "created_at": firestore.SERVER_TIMESTAMP,
     }
+    _ensure_worker()
     try:
-        _get_client().collection("logs").add(doc)
-    except Exception as e:
-        print("Firestore logging failed:", repr(e))
-
+        _queue.put_nowait(doc)
+    except queue.Full:
+        print("Firestore logging dropped (queue full):", action)
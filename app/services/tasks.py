@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .tickets import send_ticket, ticket_email_html
+
+# Work that should not hold up the HTTP response. Jobs run on a small
+# per-worker thread pool and must not touch the request or db session.
+_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ticket-dispatch")
+
+
+def dispatch_ticket(booking_id: int, ticket_code: str, to_email: str, event_title: str) -> None:
+    try:
+        send_ticket(to_email, ticket_code, ticket_email_html(event_title, ticket_code))
+    except Exception as e:
+        print(f"Ticket dispatch failed for booking {booking_id}:", repr(e))
+
+
+def enqueue_ticket_dispatch(booking_id: int, ticket_code: str, to_email: str, event_title: str) -> None:
+    """Queue the QR + email for a new booking; no-op unless both functions are configured."""
+    if not to_email:
+        return
+
+    from .external import ticket_functions_configured
+
+    if not ticket_functions_configured():
+        return
+    _executor.submit(dispatch_ticket, booking_id, ticket_code, to_email, event_title)
@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from html import escape
+from typing import Any, Dict
+
+# The QR + email pipeline shared by the booking dispatch and the API's
+# (re)send endpoints. Callers pass plain values only, so it can run on
+# worker threads without touching the request or db session.
+
+TICKET_EMAIL_SUBJECT = "Your Campus Event Ticket"
+
+_TICKET_HTML = (
+    "<p>Thanks for booking <strong>{title}</strong>.</p>"
+    "<p>Your ticket code is <strong>{code}</strong>.</p>"
+    "<p>Show the QR code at check-in.</p>"
+)
+
+
+class TicketSendError(Exception):
+    """A ticket email that failed; `reason` says which call failed."""
+
+    QR = "qr_error"
+    EMAIL = "email_error"
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def ticket_email_html(event_title: str, ticket_code: str) -> str:
+    # event titles are admin-entered free text
+    return _TICKET_HTML.format_map({"title": escape(event_title), "code": ticket_code})
+
+
+def send_ticket(to_email: str, ticket_code: str, html: str) -> Dict[str, Any]:
+    """Fetch the ticket's QR and email it with `html` as the body.
+
+    Returns the email function's response; raises TicketSendError.
+    """
+    from .external import fetch_qr_png, send_ticket_email
+
+    try:
+        qr_png = fetch_qr_png(ticket_code)
+    except Exception as e:
+        raise TicketSendError(TicketSendError.QR, str(e))
+
+    try:
+        return send_ticket_email(to_email, TICKET_EMAIL_SUBJECT, html, qr_png)
+    except Exception as e:
+        raise TicketSendError(TicketSendError.EMAIL, str(e))
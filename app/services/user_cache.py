@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from ..extensions import db
+from ..models import User
+
+
+class UserCache:
+    """Short-lived cache for the Flask-Login user loader.
+
+    Every authenticated request resolves current_user from the session's
+    user id. Column values are kept for `ttl` seconds and re-attached to
+    the request's session with merge(load=False), so a hit costs no SELECT.
+    """
+
+    def __init__(self, ttl: float = 30, maxsize: int = 10_000):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: Dict[int, Tuple[Dict[str, Any], float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, user_id: int) -> Optional[User]:
+        with self._lock:
+            hit = self._entries.get(user_id)
+
+        if hit and hit[1] > time.monotonic():
+            user = User(**hit[0])
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+
+        user = db.session.get(User, user_id)
+        if user is not None and self.ttl > 0:
+            values = {attr.key: getattr(user, attr.key) for attr in sa_inspect(User).column_attrs}
+            with self._lock:
+                if len(self._entries) >= self.maxsize:
+                    self._entries.pop(next(iter(self._entries)))
+                self._entries[user_id] = (values, time.monotonic() + self.ttl)
+        return user
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -1,20 +1,18 @@
 from __future__ import annotations
 
-import json
+import hmac
 import os
-from datetime import datetime, timezone
+import threading
 from typing import Any, Dict, Optional, Tuple
 
+import orjson
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from google.cloud import firestore
 
 
-def _json(status: int, payload: Dict[str, Any]) -> Tuple[str, int, Dict[str, str]]:
-    return (json.dumps(payload), status, {"Content-Type": "application/json"})
-
-
-def _utc_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+def _json(status: int, payload: Dict[str, Any]) -> Tuple[bytes, int, Dict[str, str]]:
+    return (orjson.dumps(payload), status, {"Content-Type": "application/json"})
 
 
 def _require_env(name: str) -> str:
@@ -24,42 +22,98 @@ def _require_env(name: str) -> str:
     return value
 
 
-def _get_pg_conn():
-    conn_name = _require_env("CLOUD_SQL_CONNECTION_NAME")
-    db_name = _require_env("DB_NAME")
-    db_user = _require_env("DB_USER")
-    db_pass = _require_env("DB_PASS")
+# Reused across warm invocations so a check-in doesn't pay for a new
+# Cloud SQL connection (socket setup + auth) on every request.
+_POOL: Optional[ThreadedConnectionPool] = None
+_POOL_LOCK = threading.Lock()
+
+
+def _get_pool() -> ThreadedConnectionPool:
+    global _POOL
+    if _POOL is None:
+        with _POOL_LOCK:
+            if _POOL is None:
+                conn_name = _require_env("CLOUD_SQL_CONNECTION_NAME")
+                db_name = _require_env("DB_NAME")
+                db_user = _require_env("DB_USER")
+                db_pass = _require_env("DB_PASS")
+
+                # Cloud Functions (gen2) supports Cloud SQL via unix socket mount:
+                # host=/cloudsql/<PROJECT:REGION:INSTANCE>
+                _POOL = ThreadedConnectionPool(
+                    1,
+                    4,
+                    dbname=db_name,
+                    user=db_user,
+                    password=db_pass,
+                    host=f"/cloudsql/{conn_name}",
+                    connect_timeout=5,
+                )
+    return _POOL
+
+
+def _fetch_booking(ticket_code: str, event_id: int):
+    pool = _get_pool()
+    # A pooled connection may have been closed server-side while the
+    # instance was idle; drop it and retry once on a fresh one.
+    for attempt in range(2):
+        conn = pool.getconn()
+        try:
+            with conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        """
+                        SELECT id, user_id, event_id, ticket_code, created_at
+                        FROM bookings
+                        WHERE ticket_code = %s AND event_id = %s
+                        LIMIT 1
+                        """,
+                        (ticket_code, event_id),
+                    )
+                    row = cur.fetchone()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            pool.putconn(conn, close=True)
+            if attempt:
+                raise
+            continue
+        except Exception:
+            pool.putconn(conn, close=True)
+            raise
+        pool.putconn(conn)
+        return row
+
+
+_fs: Optional[firestore.Client] = None
 
-    # Cloud Functions (gen2) supports Cloud SQL via unix socket mount:
-    # host=/cloudsql/<PROJECT:REGION:INSTANCE>
-    return psycopg2.connect(
-        dbname=db_name,
-        user=db_user,
-        password=db_pass,
-        host=f"/cloudsql/{conn_name}",
-        connect_timeout=5,
-    )
+# Function env is fixed for an instance's lifetime, so read it at cold start
+_SECRET = os.environ.get("CHECKIN_FUNCTION_SECRET", "").encode()
+_LOGS_DISABLED = os.environ.get("DISABLE_FIRESTORE_LOGS") == "1"
 
 
 def _fs_client() -> firestore.Client:
-    project = os.environ.get("GOOGLE_CLOUD_PROJECT") or os.environ.get("GCP_PROJECT")
-    db_name = os.environ.get("FIRESTORE_DB")
-    if project and db_name:
-        return firestore.Client(project=project, database=db_name)
-    if db_name:
-        return firestore.Client(database=db_name)
-    if project:
-        return firestore.Client(project=project)
-    return firestore.Client()
+    # One client (and gRPC channel) per instance, as in app/services/logging_service.py
+    global _fs
+    if _fs is None:
+        project = os.environ.get("GOOGLE_CLOUD_PROJECT") or os.environ.get("GCP_PROJECT")
+        db_name = os.environ.get("FIRESTORE_DB")
+        if project and db_name:
+            _fs = firestore.Client(project=project, database=db_name)
+        elif db_name:
+            _fs = firestore.Client(database=db_name)
+        elif project:
+            _fs = firestore.Client(project=project)
+        else:
+            _fs = firestore.Client()
+    return _fs
 
 
 def _log(action: str, meta: Optional[Dict[str, Any]] = None) -> None:
-    if os.environ.get("DISABLE_FIRESTORE_LOGS") == "1":
+    if _LOGS_DISABLED:
         return
     doc = {
         "action": action,
         "meta": meta or {},
-        "created_at": _utc_iso(),
+        "created_at": firestore.SERVER_TIMESTAMP,
         "source": "cloud_function",
     }
     try:
@@ -70,9 +124,8 @@ def _log(action: str, meta: Optional[Dict[str, Any]] = None) -> None:
 
 def checkin_validate(request):
     # Shared-secret header
-    expected = os.environ.get("CHECKIN_FUNCTION_SECRET", "")
     provided = request.headers.get("X-Checkin-Secret", "")
-    if not expected or provided != expected:
+    if not _SECRET or not hmac.compare_digest(provided.encode(), _SECRET):
         _log("checkin_denied", {"reason": "bad_secret"})
         return _json(401, {"error": "unauthorized"})
 
@@ -92,27 +145,10 @@ def checkin_validate(request):
         return _json(400, {"error": "bad_request", "message": "event_id must be a positive integer"})
 
     try:
-        conn = _get_pg_conn()
-        with conn:
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    SELECT id, user_id, event_id, ticket_code, created_at
-                    FROM bookings
-                    WHERE ticket_code = %s AND event_id = %s
-                    LIMIT 1
-                    """,
-                    (ticket_code, event_id_int),
-                )
-                row = cur.fetchone()
+        row = _fetch_booking(ticket_code, event_id_int)
     except Exception as e:
         _log("checkin_error", {"error": repr(e)})
         return _json(500, {"error": "server_error"})
-    finally:
-        try:
-            conn.close()
-        except Exception:
-            pass
 
     if not row:
         _log("checkin_invalid", {"event_id": event_id_int})
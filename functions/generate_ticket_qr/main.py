@@ -2,21 +2,65 @@ from __future__ import annotations
 
 import base64
 import io
-import json
+import hmac
 import os
+from functools import lru_cache
 from typing import Any, Dict, Tuple
 
+import orjson
 import qrcode
 
 
-def _json(status: int, payload: Dict[str, Any]) -> Tuple[str, int, Dict[str, str]]:
-    return (json.dumps(payload), status, {"Content-Type": "application/json"})
+# Read at cold start and pre-encoded for compare_digest
+_SECRET = os.environ.get("QR_FUNCTION_SECRET", "").encode()
+
+
+def _json(status: int, payload: Dict[str, Any]) -> Tuple[bytes, int, Dict[str, str]]:
+    return (orjson.dumps(payload), status, {"Content-Type": "application/json"})
+
+
+# The same ticket is rendered for the booking email and again whenever the
+# holder opens it, so warm instances keep recent PNGs instead of re-encoding.
+@lru_cache(maxsize=1024)
+def _render_png(ticket_code: str) -> bytes:
+    buf = io.BytesIO()
+    qrcode.make(ticket_code).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=1024)
+def _render_svg(ticket_code: str) -> bytes:
+    # One <path> straight from the module matrix: each run of dark modules
+    # in a row becomes a single rectangle, no raster or zlib pass.
+    qr = qrcode.QRCode()
+    qr.add_data(ticket_code)
+    qr.make(fit=True)
+    matrix = qr.get_matrix()
+
+    runs = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            runs.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+
+    size = len(matrix)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size * 10}" height="{size * 10}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/>'
+        f'<path fill="#000" d="{"".join(runs)}"/></svg>'
+    ).encode("utf-8")
 
 
 def generate_ticket_qr(request):
-    expected = os.environ.get("QR_FUNCTION_SECRET", "")
     provided = request.headers.get("X-QR-Secret", "")
-    if not expected or provided != expected:
+    if not _SECRET or not hmac.compare_digest(provided.encode(), _SECRET):
         return _json(401, {"error": "unauthorized"})
 
     data = request.get_json(silent=True) or {}
@@ -25,10 +69,17 @@ def generate_ticket_qr(request):
     if not ticket_code:
         return _json(400, {"error": "bad_request", "message": "ticket_code is required"})
 
-    img = qrcode.make(ticket_code)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    png_b64 = base64.b64encode(buf.getvalue()).decode("utf-8")
+    # Internal callers ask for the bytes directly instead of base64-in-JSON.
+    # SVG is for browsers; email stays PNG since most mail clients block SVG.
+    wanted = request.accept_mimetypes.best_match(["application/json", "image/png", "image/svg+xml"])
+    if wanted == "image/svg+xml":
+        return (_render_svg(ticket_code), 200, {"Content-Type": "image/svg+xml"})
+
+    png = _render_png(ticket_code)
+    if wanted == "image/png":
+        return (png, 200, {"Content-Type": "image/png"})
+
+    png_b64 = base64.b64encode(png).decode("utf-8")
 
     return _json(200, {
         "ticket_code": ticket_code,
@@ -1,70 +1,86 @@
 from __future__ import annotations
 
 import base64
-import json
+import hmac
 import os
 from typing import Any, Dict, Tuple
 
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
 
+# Module scope so warm instances keep the TLS connection to SendGrid
+_HTTP = requests.Session()
+_HTTP.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=8))
 
-def _json(status: int, payload: Dict[str, Any]) -> Tuple[str, int, Dict[str, str]]:
-    return (json.dumps(payload), status, {"Content-Type": "application/json"})
+# Parts of the SendGrid payload that are the same for every email
+_PLAIN_TEXT_CONTENT = {"type": "text/plain", "value": "Your ticket is attached (QR code)."}
+_QR_ATTACHMENT = {
+    "type": "image/png",
+    "filename": "ticket-qr.png",
+    "disposition": "inline",
+    "content_id": "ticketqr",
+}
+_QR_IMG_TAG = '<p><img alt="Ticket QR" src="cid:ticketqr" /></p>'
+
+# Secrets and sender are read at cold start rather than per email
+_SECRET = os.environ.get("EMAIL_FUNCTION_SECRET", "").encode()
+_SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY", "")
+_SENDGRID_FROM_EMAIL = os.environ.get("SENDGRID_FROM_EMAIL", "")
+
+
+def _json(status: int, payload: Dict[str, Any]) -> Tuple[bytes, int, Dict[str, str]]:
+    return (orjson.dumps(payload), status, {"Content-Type": "application/json"})
 
 
 def send_booking_email(request):
-    expected = os.environ.get("EMAIL_FUNCTION_SECRET", "")
     provided = request.headers.get("X-Email-Secret", "")
-    if not expected or provided != expected:
+    if not _SECRET or not hmac.compare_digest(provided.encode(), _SECRET):
         return _json(401, {"error": "unauthorized"})
 
-    data = request.get_json(silent=True) or {}
+    # multipart with the raw PNG in "qr", or JSON with "qr_png_base64"
+    qr_file = request.files.get("qr")
+    if qr_file:
+        data = request.form
+        # base64 happens once, here, because SendGrid's API requires it
+        qr_png_base64 = base64.b64encode(qr_file.read()).decode("ascii")
+    else:
+        data = request.get_json(silent=True) or {}
+        qr_png_base64 = (data.get("qr_png_base64") or "").strip()
+
     to_email = (data.get("to_email") or "").strip()
     subject = (data.get("subject") or "").strip() or "Your Campus Event Ticket"
     html = (data.get("html") or "").strip() or "<p>Your ticket is attached.</p>"
-    qr_png_base64 = (data.get("qr_png_base64") or "").strip()
 
     if not to_email:
         return _json(400, {"error": "bad_request", "message": "to_email is required"})
     if not qr_png_base64:
         return _json(400, {"error": "bad_request", "message": "qr_png_base64 is required"})
 
-    api_key = os.environ.get("SENDGRID_API_KEY", "")
-    sendgrid_from_email = os.environ.get("SENDGRID_FROM_EMAIL", "")
-    if not api_key:
+    if not _SENDGRID_API_KEY:
         return _json(500, {"error": "server_error", "message": "SENDGRID_API_KEY not set"})
-    if not sendgrid_from_email:
+    if not _SENDGRID_FROM_EMAIL:
         return _json(500, {"error": "server_error", "message": "SENDGRID_FROM_EMAIL not set"})
 
     if "cid:ticketqr" not in html:
-        html = html + '<p><img alt="Ticket QR" src="cid:ticketqr" /></p>'
+        html = html + _QR_IMG_TAG
 
     payload = {
         "personalizations": [{"to": [{"email": to_email}]}],
-        "from": {"email": sendgrid_from_email},
+        "from": {"email": _SENDGRID_FROM_EMAIL},
         "subject": subject,
-        "content": [
-            {"type": "text/plain", "value": "Your ticket is attached (QR code)."},
-            {"type": "text/html", "value": html},
-        ],
-        "attachments": [
-            {
-                "content": qr_png_base64,
-                "type": "image/png",
-                "filename": "ticket-qr.png",
-                "disposition": "inline",
-                "content_id": "ticketqr",
-            }
-        ],
+        "content": [_PLAIN_TEXT_CONTENT, {"type": "text/html", "value": html}],
+        "attachments": [{**_QR_ATTACHMENT, "content": qr_png_base64}],
     }
 
-    r = requests.post(
+    # orjson encodes the large base64 attachment in C, straight to bytes
+    r = _HTTP.post(
         "https://api.sendgrid.com/v3/mail/send",
         headers={
-            "Authorization": f"Bearer {api_key}",
+            "Authorization": f"Bearer {_SENDGRID_API_KEY}",
             "Content-Type": "application/json",
         },
-        json=payload,
+        data=orjson.dumps(payload),
         timeout=10,
     )
 
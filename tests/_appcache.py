@@ -0,0 +1,18 @@
+from typing import Any, Dict
+
+from flask import Flask
+
+from app import create_app
+
+_apps: Dict[str, Flask] = {}
+
+
+def get_app(cfg: Dict[str, Any]) -> Flask:
+    # One app per distinct test config, shared by every test class that asks
+    # for it; blueprints, extensions and the Jinja env are only set up once.
+    # Test classes still push their own app contexts.
+    key = repr(sorted(cfg.items()))
+    app = _apps.get(key)
+    if app is None:
+        app = _apps[key] = create_app(cfg)
+    return app
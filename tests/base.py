@@ -1,68 +1,152 @@
+import sqlite3
 import unittest
+from contextlib import contextmanager
 from datetime import datetime, timedelta, timezone
 
-from app import create_app
+from sqlalchemy import event, insert
+from sqlalchemy.pool import StaticPool
+
 from app.extensions import db
-from app.models import User, Event
+from app.models import User, Event, hash_password
+from app.services.booking import create_booking
+from tests._appcache import get_app
+
+# Fixed start time for seeded and test-created events, so fixture data is
+# the same on every run
+T0 = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc)
 
 
 class BaseTestCase(unittest.TestCase):
-    def setUp(self):
-        self.app = create_app({
+    # The app, schema and seed rows are built once per class and copied into
+    # a side database with SQLite's backup API. setUp copies that snapshot
+    # back over the app's database, so every test starts from the seed state
+    # whatever it committed before.
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = get_app({
             "TESTING": True,
             "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
+            # One connection, hence one in-memory database, for the whole app.
+            # BEGIN IMMEDIATE takes SQLite's write lock when a transaction
+            # opens, the way the serialized writers in a real deployment do.
+            "SQLALCHEMY_ENGINE_OPTIONS": {
+                "poolclass": StaticPool,
+                "connect_args": {"check_same_thread": False, "isolation_level": "IMMEDIATE"},
+            },
             "WTF_CSRF_ENABLED": False,
             "SECRET_KEY": "test-secret",
         })
-        self.client = self.app.test_client()
 
-        with self.app.app_context():
+        with cls.app.app_context():
+            cls.engine = db.engine
             db.create_all()
 
-            # Seed users
-            self.user = User(email="user@test.com", role="user")
-            self.user.set_password("pass")
+            # Seed rows straight through a Core connection in one transaction:
+            # no session or unit of work, ids come back via RETURNING
+            password_hash = hash_password("pass")
+            users, events = User.__table__, Event.__table__
+            with cls.engine.begin() as conn:
+                cls.user_id, cls.user2_id, cls.admin_id = conn.execute(
+                    insert(users).returning(users.c.id, sort_by_parameter_order=True),
+                    [
+                        {"email": "user@test.com", "role": "user", "password_hash": password_hash},
+                        {"email": "user2@test.com", "role": "user", "password_hash": password_hash},
+                        {"email": "admin@test.com", "role": "admin", "password_hash": password_hash},
+                    ],
+                ).scalars().all()
 
-            self.admin = User(email="admin@test.com", role="admin")
-            self.admin.set_password("pass")
+                cls.event_id = conn.execute(
+                    insert(events).returning(events.c.id),
+                    {
+                        "title": "Seed Event",
+                        "location": "BU",
+                        "start_time": T0,
+                        "end_time": T0 + timedelta(hours=1),
+                        "capacity": 5,
+                        "created_by": cls.admin_id,
+                    },
+                ).scalar_one()
 
-            db.session.add_all([self.user, self.admin])
-            db.session.commit()
+        cls._snapshot = sqlite3.connect(":memory:")
+        cls._copy_db(to_snapshot=True)
+
+        # Log each seed account in once and keep its signed session cookie;
+        # following the redirect consumes the "Logged in." flash
+        cls._session_cookies = {}
+        for email in ("user@test.com", "user2@test.com", "admin@test.com"):
+            client = cls.app.test_client()
+            client.post("/auth/login", data={"email": email, "password": "pass"}, follow_redirects=True)
+            cls._session_cookies[email] = client.get_cookie(cls.app.config["SESSION_COOKIE_NAME"]).value
 
-            # Seed an event created by admin
-            start = datetime.now(timezone.utc).replace(microsecond=0)
-            end = start + timedelta(hours=1)
+    @classmethod
+    def tearDownClass(cls):
+        cls._snapshot.close()
+        with cls.app.app_context():
+            db.drop_all()
 
-            event = Event(
-                title="Seed Event",
+    @classmethod
+    def _copy_db(cls, to_snapshot: bool):
+        raw = cls.engine.raw_connection()
+        try:
+            if to_snapshot:
+                raw.driver_connection.backup(cls._snapshot)
+            else:
+                cls._snapshot.backup(raw.driver_connection)
+        finally:
+            raw.close()
+
+    def setUp(self):
+        self._copy_db(to_snapshot=False)
+        self.client = self.app.test_client()
+        self.app.extensions["user_cache"].clear()
+
+    def make_event(self, capacity: int = 1, title: str = "Bookable") -> int:
+        # discarded when the next test restores the snapshot
+        with self.app.app_context():
+            extra = Event(
+                title=title,
                 location="BU",
-                start_time=start,
-                end_time=end,
-                capacity=5,
-                created_by=self.admin.id,
+                start_time=T0,
+                end_time=T0 + timedelta(hours=1),
+                capacity=capacity,
+                created_by=self.admin_id,
             )
-            db.session.add(event)
+            db.session.add(extra)
             db.session.commit()
+            return extra.id
 
-            self.event_id = event.id
-
-    def tearDown(self):
+    def _book(self, event_id: int, user_id: int) -> int:
+        # service call for tests that need a booking but aren't testing the view
         with self.app.app_context():
-            db.drop_all()
+            return create_booking(user_id, event_id).id
+
+    @contextmanager
+    def count_statements(self):
+        # yields the SQL statements the engine executes inside the block
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(self.engine, "before_cursor_execute", record)
+
+    def _login_as(self, email: str):
+        # the login view itself is covered in test_auth
+        self.client.set_cookie(self.app.config["SESSION_COOKIE_NAME"], self._session_cookies[email])
 
     def login_user(self):
-        return self.client.post(
-            "/auth/login",
-            data={"email": "user@test.com", "password": "pass"},
-            follow_redirects=True,
-        )
+        self._login_as("user@test.com")
+
+    def login_user2(self):
+        self._login_as("user2@test.com")
 
     def login_admin(self):
-        return self.client.post(
-            "/auth/login",
-            data={"email": "admin@test.com", "password": "pass"},
-            follow_redirects=True,
-        )
+        self._login_as("admin@test.com")
 
     def logout(self):
-        return self.client.get("/auth/logout", follow_redirects=True)
+        return self.client.get("/auth/logout")
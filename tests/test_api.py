@@ -1,8 +1,9 @@
-from datetime import datetime, timedelta, timezone
+from datetime import timedelta
+from unittest.mock import patch
 
 from app.extensions import db
-from app.models import Event
-from tests.base import BaseTestCase
+from app.models import Booking, Event
+from tests.base import BaseTestCase, T0
 
 
 class ApiTests(BaseTestCase):
@@ -14,18 +15,36 @@ class ApiTests(BaseTestCase):
         self.assertIn("events", data)
         self.assertGreaterEqual(len(data["events"]), 1)
 
+    def test_list_events_reports_booked_counts(self):
+        self._book(self.event_id, self.user_id)
+
+        r2 = self.client.get("/api/events")
+        events = {e["id"]: e for e in r2.get_json()["events"]}
+        self.assertEqual(events[self.event_id]["booked"], 1)
+        self.assertEqual(events[self.event_id]["remaining"], 4)
+
+    def test_event_detail_honours_etag(self):
+        r1 = self.client.get(f"/api/events/{self.event_id}")
+        self.assertEqual(r1.status_code, 200)
+        etag = r1.headers["ETag"]
+
+        r2 = self.client.get(f"/api/events/{self.event_id}", headers={"If-None-Match": etag})
+        self.assertEqual(r2.status_code, 304)
+
+        # a booking changes the event, so the old ETag no longer matches
+        self._book(self.event_id, self.user_id)
+        r3 = self.client.get(f"/api/events/{self.event_id}", headers={"If-None-Match": etag})
+        self.assertEqual(r3.status_code, 200)
+
     def test_create_event_admin_only(self):
         # logged in as normal user
         self.login_user()
 
-        start = datetime.now(timezone.utc).replace(microsecond=0)
-        end = start + timedelta(hours=1)
-
         payload = {
             "title": "Nope",
             "location": "BU",
-            "start_time": start.isoformat(),
-            "end_time": end.isoformat(),
+            "start_time": T0.isoformat(),
+            "end_time": (T0 + timedelta(hours=1)).isoformat(),
             "capacity": 10,
             "description": "test",
         }
@@ -36,14 +55,11 @@ class ApiTests(BaseTestCase):
     def test_create_event_admin_success(self):
         self.login_admin()
 
-        start = datetime.now(timezone.utc).replace(microsecond=0)
-        end = start + timedelta(hours=1)
-
         payload = {
             "title": "Admin Created",
             "location": "BU",
-            "start_time": start.isoformat(),
-            "end_time": end.isoformat(),
+            "start_time": T0.isoformat(),
+            "end_time": (T0 + timedelta(hours=1)).isoformat(),
             "capacity": 10,
             "description": "test",
         }
@@ -56,8 +72,9 @@ class ApiTests(BaseTestCase):
         self.assertEqual(data["event"]["title"], "Admin Created")
 
         with self.app.app_context():
-            created = db.session.query(Event).filter_by(title="Admin Created").first()
+            created = db.session.get(Event, data["event"]["id"])
             self.assertIsNotNone(created)
+            self.assertEqual(created.capacity, 10)
 
     def test_api_booking_and_prevent_double_booking(self):
         self.login_user()
@@ -70,16 +87,115 @@ class ApiTests(BaseTestCase):
         self.assertEqual(r2.status_code, 409)
 
     def test_my_bookings_returns_event_details(self):
+        other_id = self.make_event(capacity=5, title="Other Event")
+        self._book(self.event_id, self.user_id)
+        self._book(other_id, self.user_id)
         self.login_user()
 
-        r1 = self.client.post(f"/api/events/{self.event_id}/book")
-        self.assertEqual(r1.status_code, 201)
+        # bookings + one IN query for their events, however many bookings
+        # (the first request after login also loads the user itself)
+        with self.count_statements() as statements:
+            r2 = self.client.get("/api/bookings")
 
-        r2 = self.client.get("/api/bookings")
         self.assertEqual(r2.status_code, 200)
+        self.assertLessEqual(len([s for s in statements if "FROM users" not in s]), 2)
 
         data = r2.get_json()
         self.assertIn("bookings", data)
-        self.assertGreaterEqual(len(data["bookings"]), 1)
+        self.assertEqual(len(data["bookings"]), 2)
         self.assertIn("event", data["bookings"][0])
-        self.assertEqual(data["bookings"][0]["event"]["id"], self.event_id)
+        self.assertEqual(
+            {b["event"]["id"] for b in data["bookings"]}, {self.event_id, other_id}
+        )
+
+    def test_email_batch_rejects_other_users_bookings(self):
+        admin_booking_id = self._book(self.event_id, self.admin_id)
+
+        self.login_user()
+        r2 = self.client.post("/api/bookings/email-batch", json={"booking_ids": [admin_booking_id]})
+        self.assertEqual(r2.status_code, 403)
+
+        r3 = self.client.post("/api/bookings/email-batch", json={"booking_ids": []})
+        self.assertEqual(r3.status_code, 400)
+
+    def test_email_batch_sends_each_ticket_and_reports_failures(self):
+        other_id = self.make_event(capacity=5, title="Other Event")
+        ok_id = self._book(self.event_id, self.user_id)
+        failing_id = self._book(other_id, self.user2_id)
+        # an admin batch across users, so the owners aren't the current user
+        self.login_admin()
+        self.client.get("/api/me")  # load current_user into the user cache
+
+        with self.app.app_context():
+            failing_code = db.session.get(Booking, failing_id).ticket_code
+
+        def send(to_email, subject, html, qr_png):
+            if failing_code in html:
+                raise RuntimeError("Email Function HTTP 500")
+            return {"ok": True}
+
+        with self.count_statements() as statements, \
+                patch("app.services.external.fetch_qr_png", return_value=b"png") as fetch_qr, \
+                patch("app.services.external.send_ticket_email", side_effect=send) as send_email:
+            r = self.client.post("/api/bookings/email-batch", json={"booking_ids": [ok_id, failing_id]})
+
+        self.assertEqual(r.status_code, 200)
+        data = r.get_json()
+        self.assertFalse(data["ok"])
+
+        results = {res["booking_id"]: res for res in data["results"]}
+        self.assertEqual(set(results), {ok_id, failing_id})
+        self.assertTrue(results[ok_id]["ok"])
+        self.assertFalse(results[failing_id]["ok"])
+        self.assertEqual(results[failing_id]["error"], "email_error")
+        self.assertIn("HTTP 500", results[failing_id]["message"])
+
+        self.assertEqual(fetch_qr.call_count, 2)
+        self.assertEqual(send_email.call_count, 2)
+        self.assertEqual(
+            {c.args[0] for c in send_email.call_args_list}, {"user@test.com", "user2@test.com"}
+        )
+
+        # bookings + one IN query each for their users and events, not one lookup per ticket
+        self.assertLessEqual(len(statements), 3)
+
+    def test_ticket_qr_as_svg(self):
+        booking_id = self._book(self.event_id, self.user_id)
+        with self.app.app_context():
+            ticket_code = db.session.get(Booking, booking_id).ticket_code
+        self.login_user()
+
+        svg = b'<svg xmlns="http://www.w3.org/2000/svg"></svg>'
+        with patch("app.services.external.fetch_qr_svg", return_value=svg) as fetch_svg, \
+                patch("app.services.external.fetch_qr_png") as fetch_png, \
+                patch("app.services.external.call_qr_function") as call_qr:
+            r = self.client.get(f"/api/bookings/ticket/{ticket_code}/qr?format=svg")
+
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.mimetype, "image/svg+xml")
+        self.assertEqual(r.data, svg)
+        fetch_svg.assert_called_once_with(ticket_code)
+        fetch_png.assert_not_called()
+        call_qr.assert_not_called()
+
+    def test_fetch_qr_svg_asks_for_svg(self):
+        from app.services import external
+
+        with patch.object(external, "_post_qr") as post_qr:
+            post_qr.return_value.headers = {"Content-Type": "image/svg+xml; charset=utf-8"}
+            post_qr.return_value.content = b"<svg/>"
+            self.assertEqual(external.fetch_qr_svg("abc"), b"<svg/>")
+
+        post_qr.assert_called_once_with(json={"ticket_code": "abc"}, headers={"Accept": "image/svg+xml"})
+
+    def test_fetch_qr_png_rejects_non_image_response(self):
+        from app.services import external
+
+        # e.g. an old QR build that still answers with base64 JSON
+        with patch.object(external, "_post_qr") as post_qr:
+            post_qr.return_value.headers = {"Content-Type": "application/json"}
+            post_qr.return_value.content = b'{"qr_png_base64": "..."}'
+            with self.assertRaises(RuntimeError) as ctx:
+                external.fetch_qr_png("abc")
+
+        self.assertIn("application/json", str(ctx.exception))
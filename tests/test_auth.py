@@ -1,3 +1,6 @@
+from werkzeug.security import generate_password_hash
+
+from app import create_app
 from app.extensions import db
 from app.models import User
 from tests.base import BaseTestCase
@@ -9,9 +12,8 @@ class AuthTests(BaseTestCase):
         r = self.client.post(
             "/auth/register",
             data={"email": "new@test.com", "password": "pass"},
-            follow_redirects=True,
         )
-        self.assertEqual(r.status_code, 200)
+        self.assertEqual(r.status_code, 302)
 
         with self.app.app_context():
             u = db.session.query(User).filter_by(email="new@test.com").first()
@@ -23,14 +25,69 @@ class AuthTests(BaseTestCase):
         r2 = self.client.post(
             "/auth/login",
             data={"email": "new@test.com", "password": "pass"},
-            follow_redirects=True,
         )
-        self.assertEqual(r2.status_code, 200)
+        self.assertEqual(r2.status_code, 302)
+        self.assertTrue(r2.location.endswith("/auth/me"))
 
     def test_login_rejects_bad_password(self):
         r = self.client.post(
             "/auth/login",
             data={"email": "user@test.com", "password": "wrong"},
-            follow_redirects=True,
         )
-        self.assertEqual(r.status_code, 200)  # page renders with flash error
+        # bounced back to the login form with a flash error
+        self.assertEqual(r.status_code, 302)
+        self.assertTrue(r.location.endswith("/auth/login"))
+
+    def _set_legacy_hash(self):
+        # accounts created before the argon2 switch carry Werkzeug hashes
+        with self.app.app_context():
+            user = db.session.get(User, self.user_id)
+            user.password_hash = generate_password_hash("pass", method="pbkdf2:sha256:1000")
+            db.session.commit()
+
+    def test_legacy_werkzeug_hash_still_logs_in(self):
+        self._set_legacy_hash()
+
+        r = self.client.post("/auth/login", data={"email": "user@test.com", "password": "pass"})
+        self.assertEqual(r.status_code, 302)
+        self.assertTrue(r.location.endswith("/auth/me"))
+
+    def test_login_upgrades_legacy_hash_to_argon2(self):
+        self._set_legacy_hash()
+
+        self.client.post("/auth/login", data={"email": "user@test.com", "password": "wrong"})
+        with self.app.app_context():
+            self.assertFalse(db.session.get(User, self.user_id).password_hash.startswith("$argon2"))
+
+        self.client.post("/auth/login", data={"email": "user@test.com", "password": "pass"})
+        with self.app.app_context():
+            self.assertTrue(db.session.get(User, self.user_id).password_hash.startswith("$argon2"))
+
+    def _user_selects(self, path):
+        with self.count_statements() as statements:
+            self.assertEqual(self.client.get(path).status_code, 200)
+        return [s for s in statements if "FROM users" in s]
+
+    def test_user_loader_cache_hit_skips_select(self):
+        self.login_user()
+
+        self.assertEqual(len(self._user_selects("/api/me")), 1)
+        self.assertEqual(self._user_selects("/api/me"), [])
+
+    def test_logout_evicts_cached_user(self):
+        self.login_user()
+        self.client.get("/api/me")
+        cache = self.app.extensions["user_cache"]
+        self.assertIn(self.user_id, cache._entries)
+
+        self.logout()
+        self.assertNotIn(self.user_id, cache._entries)
+
+    def test_user_loader_uses_the_request_apps_cache(self):
+        # login_manager is module-global; a later app must not take over the loader
+        other = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:", "USER_CACHE_TTL": 0})
+        self.login_user()
+        self.client.get("/api/me")
+
+        self.assertIn(self.user_id, self.app.extensions["user_cache"]._entries)
+        self.assertEqual(other.extensions["user_cache"]._entries, {})
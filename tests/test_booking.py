@@ -1,99 +1,149 @@
-import unittest
-from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
 
-from app import create_app
 from app.extensions import db
-from app.models import User, Event, Booking
+from app.models import Event, Booking
+from app.services.booking import BookingError, cancel_booking, create_booking
+from app.services.tasks import dispatch_ticket
+from tests.base import BaseTestCase
 
 
-class BookingTests(unittest.TestCase):
+class BookingTests(BaseTestCase):
     def setUp(self):
-        self.app = create_app({
-            "TESTING": True,
-            "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-            "WTF_CSRF_ENABLED": False,
-            "SECRET_KEY": "test-secret",
-        })
-        self.client = self.app.test_client()
+        super().setUp()
+        self.event_id = self.make_event(capacity=1)
+
+    def test_double_booking_prevented(self):
+        # seats left over, so only the duplicate check can turn the second request away
+        event_id = self.make_event(capacity=5)
+        self.login_user()
+
+        r1 = self.client.post(f"/events/{event_id}/book")
+        self.assertEqual(r1.status_code, 302)
+
+        r2 = self.client.post(f"/events/{event_id}/book")
+        self.assertEqual(r2.status_code, 302)
+        with self.client.session_transaction() as sess:
+            self.assertIn(("error", "You already booked this event."), sess["_flashes"])
 
         with self.app.app_context():
-            db.create_all()
+            count = db.session.query(Booking).filter_by(event_id=event_id).count()
+            self.assertEqual(count, 1)
 
-            user = User(email="user@test.com", role="user")
-            user.set_password("pass")
+            # the duplicate is turned away before it claims a seat
+            self.assertEqual(db.session.get(Event, event_id).booked_count, 1)
 
-            admin = User(email="admin@test.com", role="admin")
-            admin.set_password("pass")
+    def test_capacity_full_blocks_second_user(self):
+        # user 1 books (fills capacity 1)
+        self.login_user()
+        r1 = self.client.post(f"/events/{self.event_id}/book")
+        self.assertEqual(r1.status_code, 302)
 
-            db.session.add_all([user, admin])
-            db.session.commit()
+        # log out user 1
+        self.logout()
 
-            start = datetime.now(timezone.utc).replace(microsecond=0)
-            end = start + timedelta(hours=1)
-
-            event = Event(
-                title="Bookable",
-                location="BU",
-                start_time=start,
-                end_time=end,
-                capacity=1,
-                created_by=admin.id,
-            )
-            db.session.add(event)
-            db.session.commit()
+        self.login_user2()
 
-            self.event_id = event.id
+        # user 2 tries to book -> should not create booking
+        r2 = self.client.post(f"/events/{self.event_id}/book")
+        self.assertEqual(r2.status_code, 302)
 
-    def tearDown(self):
         with self.app.app_context():
-            db.drop_all()
+            total = db.session.query(Booking).filter_by(event_id=self.event_id).count()
+            self.assertEqual(total, 1)
 
-    def _login_user(self):
-        return self.client.post(
-            "/auth/login",
-            data={"email": "user@test.com", "password": "pass"},
-            follow_redirects=True,
-        )
+    def test_sync_booked_counts_rebuilds_counter(self):
+        self._book(self.event_id, self.user_id)
 
-    def test_double_booking_prevented(self):
-        self._login_user()
+        with self.app.app_context():
+            db.session.get(Event, self.event_id).booked_count = 0
+            db.session.commit()
 
-        r1 = self.client.post(f"/events/{self.event_id}/book", follow_redirects=True)
-        self.assertEqual(r1.status_code, 200)
+        result = self.app.test_cli_runner().invoke(args=["sync-booked-counts"])
+        self.assertEqual(result.exit_code, 0)
+
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Event, self.event_id).booked_count, 1)
 
-        r2 = self.client.post(f"/events/{self.event_id}/book", follow_redirects=True)
-        self.assertEqual(r2.status_code, 200)
+    def test_create_booking_reports_full_event(self):
+        self._book(self.event_id, self.user_id)
 
         with self.app.app_context():
-            count = db.session.query(Booking).filter_by(event_id=self.event_id).count()
-            self.assertEqual(count, 1)
+            with self.assertRaises(BookingError) as ctx:
+                create_booking(self.user2_id, self.event_id)
+            self.assertEqual(ctx.exception.reason, BookingError.FULL)
+            self.assertEqual(db.session.get(Event, self.event_id).booked_count, 1)
+
+    def test_concurrent_duplicate_gives_claimed_seat_back(self):
+        event_id = self.make_event(capacity=5)
+        self._book(event_id, self.user_id)
+
+        # a racing request that passed the EXISTS preflight before the first
+        # booking committed: the unique constraint rejects it after claim_seat
+        with patch("app.services.booking._already_booked", return_value=False):
+            with self.app.app_context():
+                with self.assertRaises(BookingError) as ctx:
+                    create_booking(self.user_id, event_id)
+
+        self.assertEqual(ctx.exception.reason, BookingError.ALREADY_BOOKED)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Event, event_id).booked_count, 1)
 
-    def test_capacity_full_blocks_second_user(self):
-        # user 1 books (fills capacity 1)
-        self._login_user()
-        r1 = self.client.post(f"/events/{self.event_id}/book", follow_redirects=True)
-        self.assertEqual(r1.status_code, 200)
+    def test_cancel_booking_releases_seat(self):
+        booking_id = self._book(self.event_id, self.user_id)
 
-        # log out user 1
-        self.client.get("/auth/logout", follow_redirects=True)
+        with self.app.app_context():
+            cancel_booking(db.session.get(Booking, booking_id))
+            self.assertIsNone(db.session.get(Booking, booking_id))
+            self.assertEqual(db.session.get(Event, self.event_id).booked_count, 0)
+
+        # the freed seat can be booked again
+        self._book(self.event_id, self.user2_id)
 
-        # create + login user 2
+    def test_release_seat_never_goes_negative(self):
+        # a booking added outside create_booking never claimed a seat
         with self.app.app_context():
-            user2 = User(email="user2@test.com", role="user")
-            user2.set_password("pass")
-            db.session.add(user2)
+            booking = Booking(user_id=self.user_id, event_id=self.event_id, ticket_code="direct")
+            db.session.add(booking)
             db.session.commit()
 
-        self.client.post(
-            "/auth/login",
-            data={"email": "user2@test.com", "password": "pass"},
-            follow_redirects=True,
-        )
+            cancel_booking(booking)
+            self.assertEqual(db.session.get(Event, self.event_id).booked_count, 0)
 
-        # user 2 tries to book -> should not create booking
-        r2 = self.client.post(f"/events/{self.event_id}/book", follow_redirects=True)
-        self.assertEqual(r2.status_code, 200)
+        # capacity 1 still holds
+        self._book(self.event_id, self.user_id)
+        with self.app.app_context():
+            with self.assertRaises(BookingError) as ctx:
+                create_booking(self.user2_id, self.event_id)
+            self.assertEqual(ctx.exception.reason, BookingError.FULL)
+
+    def test_booking_queues_ticket_dispatch_when_configured(self):
+        event_id = self.make_event(capacity=5)
+        self.login_user()
+
+        with patch("app.services.external.ticket_functions_configured", return_value=False), \
+                patch("app.services.tasks._executor") as executor:
+            self.client.post(f"/events/{event_id}/book")
+        executor.submit.assert_not_called()
 
+        self.login_user2()
+        with patch("app.services.external.ticket_functions_configured", return_value=True), \
+                patch("app.services.tasks._executor") as executor:
+            self.client.post(f"/events/{event_id}/book")
+
+        executor.submit.assert_called_once()
         with self.app.app_context():
-            total = db.session.query(Booking).filter_by(event_id=self.event_id).count()
-            self.assertEqual(total, 1)
+            booking = db.session.query(Booking).filter_by(event_id=event_id, user_id=self.user2_id).one()
+        self.assertEqual(
+            executor.submit.call_args.args,
+            (dispatch_ticket, booking.id, booking.ticket_code, "user2@test.com", "Bookable"),
+        )
+
+    def test_dispatch_ticket_escapes_event_title(self):
+        with patch("app.services.external.fetch_qr_png", return_value=b"png"), \
+                patch("app.services.external.send_ticket_email") as send_email:
+            dispatch_ticket(1, "code123", "user@test.com", "<script>alert(1)</script>")
+
+        html = send_email.call_args.args[2]
+        self.assertIn("&lt;script&gt;", html)
+        self.assertNotIn("<script>", html)
+        self.assertIn("code123", html)
@@ -0,0 +1,27 @@
+import unittest
+from datetime import datetime
+
+from app.routes.events import parse_dt
+
+
+class ParseDtTests(unittest.TestCase):
+    def test_parses_datetime_local_value(self):
+        self.assertEqual(parse_dt("2025-01-31T09:05"), datetime(2025, 1, 31, 9, 5))
+
+    def test_rejects_bad_layout(self):
+        for value in ("2025/01/31T09:05", "2025-01-31 09:05", "2025-01-31T09:05:00", ""):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_dt(value)
+
+    def test_rejects_signs_and_spaces(self):
+        for value in ("2025-+1-01T10:00", "2025- 1-01T1 :00", "2025-01--1T10:00", "2025-01-01T１0:00"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_dt(value)
+
+    def test_rejects_out_of_range_fields(self):
+        for value in ("2025-13-01T10:00", "2025-02-30T10:00", "2025-01-01T24:00", "2025-01-01T10:60"):
+            with self.subTest(value=value):
+                with self.assertRaises(ValueError):
+                    parse_dt(value)
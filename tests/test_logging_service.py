@@ -0,0 +1,65 @@
+import queue
+import time
+import unittest
+from unittest.mock import patch
+
+from app.services import logging_service
+
+
+class LoggingServiceTests(unittest.TestCase):
+    # No app or database: each test gets a fresh queue and no writer thread,
+    # with Firestore replaced by a recorder of the batches it would commit
+
+    def setUp(self):
+        self.batches = []
+        patches = [
+            patch.object(logging_service, "_queue", queue.Queue(maxsize=logging_service._QUEUE_MAX)),
+            patch.object(logging_service, "_worker", None),
+            patch.object(logging_service, "_DISABLE", False),
+            patch.object(logging_service, "_write_batch", side_effect=lambda docs: self.batches.append(list(docs))),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _wait_until(self, condition, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("timed out waiting for the log writer")
+            time.sleep(0.01)
+
+    def test_queued_docs_are_written_in_bounded_batches(self):
+        docs = [{"n": i} for i in range(1000)]
+        for doc in docs:
+            logging_service._queue.put_nowait(doc)
+
+        logging_service._ensure_worker()
+        logging_service._flush()
+
+        self.assertFalse(logging_service._worker.is_alive())
+        self.assertTrue(all(len(b) <= logging_service._BATCH_SIZE for b in self.batches))
+        self.assertEqual([doc for b in self.batches for doc in b], docs)
+
+    def test_flush_commits_the_batch_in_progress(self):
+        # a long interval keeps the writer holding its batch until it is stopped
+        with patch.object(logging_service, "_FLUSH_INTERVAL", 60):
+            for i in range(3):
+                logging_service.log_event("test_action", user_id=i)
+            self._wait_until(logging_service._queue.empty)
+            self.assertEqual(self.batches, [])
+
+            logging_service._flush()
+
+        self.assertFalse(logging_service._worker.is_alive())
+        self.assertEqual(len(self.batches), 1)
+        self.assertEqual([doc["user_id"] for doc in self.batches[0]], [0, 1, 2])
+
+    def test_log_event_drops_when_queue_is_full(self):
+        with patch.object(logging_service, "_queue", queue.Queue(maxsize=2)), \
+                patch.object(logging_service, "_ensure_worker"):
+            for i in range(3):
+                logging_service.log_event("test_action", user_id=i)
+
+            self.assertEqual(logging_service._queue.qsize(), 2)
+            self.assertEqual([logging_service._queue.get_nowait()["user_id"] for _ in range(2)], [0, 1])